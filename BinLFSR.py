@@ -19,6 +19,58 @@ BinLFSR.py - A generic binary linear feedback shift register (LFSR) that accepts
 
 import numpy as np
 from bit_array_utils import *
+from jit_utils import njit
+
+@njit("int64(int64, int64, int64)", cache=True)
+def period(g_mask, n, seed):
+  """
+  Find the period of an LFSR by stepping it until it returns to its seed
+  :param g_mask: The taps of the connection polynomial below x^n
+  :param n: The degree of the connection polynomial (at most 62)
+  :param seed: The state to start (and stop) at
+  :return: The number of steps taken (int)
+  """
+
+  if n < 1 or n > 62:
+    raise Exception("LFSR degree must be between 1 and 62 to find a period")
+
+  mask = (1 << n) - 1
+  if seed < 0 or seed > mask:
+    raise Exception("Seed does not fit in the LFSR")
+
+  # there are only 2^n states, so a seed that recurs does so within 2^n steps
+  state = seed
+  for count in range(1, (1 << n) + 1):
+    top = (state >> (n - 1)) & 1
+    state = (state << 1) & mask
+    if top:
+      state ^= g_mask
+
+    if state == seed:
+      return count
+
+  raise Exception("Seed never recurs in the LFSR")
+
+@njit("int64(int64, int64, int64, uint8[:])", cache=True)
+def _run(state, g_mask, n, outputs):
+  """
+  Step an LFSR once for each entry of outputs, writing each 1-bit output
+  :param state: The state to start from
+  :param g_mask: The taps of the connection polynomial below x^n
+  :param n: The degree of the connection polynomial
+  :param outputs: The array to output to
+  :return: The final state (int)
+  """
+
+  mask = (1 << n) - 1
+  for i in range(outputs.shape[0]):
+    top = (state >> (n - 1)) & 1
+    state = (state << 1) & mask
+    if top:
+      state ^= g_mask
+    outputs[i] = (state >> (n - 1)) & 1
+
+  return state
 
 class BinLFSR:
 
@@ -32,6 +84,9 @@ class BinLFSR:
 
     self.g = g
     self.n = n
+    self.mask = (1 << n) - 1
+    # taps below x^n; the fed back bit always enters at x^0
+    self.g_mask = (g & self.mask) | 1
     if initstate < 0:
     
       raise Exception("Cannot seed negative numbers in LFSR")  
@@ -54,24 +109,37 @@ class BinLFSR:
       reference.)
     """
 
-    g_vec = to_bit_array(self.g, self.n + 1)
-    state_vec = to_bit_array(self.state, self.n)
-    new_state = to_bit_array(self.state * 2, self.n)
+    # shift the register up by one, and feed the bit shifted out back in
+    # through the taps of g(x)
+    top = (self.state >> (self.n - 1)) & 1
+    self.state = (self.state << 1) & self.mask
+    if top:
+      self.state ^= self.g_mask
 
-    new_state[self.n-1] = state_vec[0]
-
-    # flip the bits with a term in g(x) of this order and 1 below if necessary
-    for i in range(0,self.n - 1):
-      if g_vec[i+1]:
-        new_state[i] = state_vec[i+1] ^ state_vec[0]
-    
-    # turn the bit array back into a number
-    self.state = from_bit_array(new_state)
+    out = (self.state >> (self.n - 1)) & 1
 
     if state:
-      return new_state[0], self.state
+      return out, self.state
+    else:
+      return out
+
+  def steps_array(self, nstep):
+    """
+    Step the LFSR nstep times
+    :param nstep: number of steps to cycle through
+    :return: The 1-bit outputs (numpy array)
+    """
+
+    outputs = np.empty(nstep, dtype=np.uint8)
+
+    # the compiled loop keeps the state in a 64-bit integer
+    if self.n < 63:
+      self.state = _run(self.state & self.mask, self.g_mask, self.n, outputs)
     else:
-      return new_state[0]
+      for i in range(nstep):
+        outputs[i] = self.step()
+
+    return outputs
 
   def steps(self, nstep, outputs):
     """
@@ -81,8 +149,7 @@ class BinLFSR:
     :return: The list of 1-bit outputs
     """
 
-    for _ in range(nstep):
-      outputs.append(self.step())
+    outputs.extend(self.steps_array(nstep).tolist())
 
 
 if __name__ == "__main__":
@@ -100,17 +167,28 @@ if __name__ == "__main__":
 
   print(outputs1)
 
-  print("Resetting LFSR and displaying its states through each step:")
-  lfsr.setstate(1)
   seed = 1
-  count = 0
-  started = False
-  lfsr.setstate(seed)
-  print("State at step", count, to_bit_array(lfsr.state,len(GENERATOR)-1))
-  while lfsr.state != seed or not started:
-    count += 1
-    started = True
-    print("State at step", count, \
-      to_bit_array(lfsr.step(True)[1],len(GENERATOR)-1))
-  
-  print("The LFSR with a generator", GENERATOR, "has a period of", count)
\ No newline at end of file
+  count = period(lfsr.g_mask, lfsr.n, seed)
+  print("The LFSR with a generator", GENERATOR, "has a period of", count)
+
+  # a primitive trinomial, x^20 + x^3 + 1, has the longest possible period
+  GENERATOR = (1 << 20) | (1 << 3) | 1
+  lfsr = BinLFSR(GENERATOR, 20)
+  count = period(lfsr.g_mask, lfsr.n, seed)
+  print("The LFSR with a generator", to_bit_array(GENERATOR), \
+    "has a period of", count)
+
+  # a degree 64 register is too wide for the compiled loop, so this checks
+  # both the compiled and the fallback path of steps_array
+  print("Checking steps_array against stepping one at a time:", end=" ")
+  matches = True
+  for degree in [20, 64]:
+    lfsr_array = BinLFSR((1 << degree) | 0x1B, degree, initstate=0xACE1)
+    lfsr_step = BinLFSR((1 << degree) | 0x1B, degree, initstate=0xACE1)
+    outputs = lfsr_array.steps_array(200).tolist()
+    matches = matches and outputs == [lfsr_step.step() for _ in range(200)] \
+      and lfsr_array.state == lfsr_step.state
+  if matches:
+    print("(Outputs match)")
+  else:
+    print("(Outputs differ)")
@@ -19,10 +19,77 @@ BinPolyDiv.py - An implementation of the BinPolyDiv class, which can divide two
 """
 
 
+import functools
+
 import numpy as np
 
-from BinLFSR import BinLFSR
 from bit_array_utils import *
+from jit_utils import HAVE_NUMBA, njit, prange
+
+ITEM_SIZE = 8 # size of a byte
+
+SLICES = 8 # bytes consumed per step of the sliced table loop
+
+@njit("uint64(uint8[:], uint64[:, :], uint64, uint64)", cache=True)
+def _crc_table(buf, tables, p, mask):
+  """
+  Divide a message of bytes, multiplied by x^p, by g using byte tables,
+  eight bytes at a time and then a byte at a time. Requires p <= 64.
+  :param buf: The message bytes
+  :param tables: Row k holds the remainder of each byte b * x^(p + 8k)
+  :param p: The degree of g
+  :param mask: The mask of the p-bit register
+  :return: The remainder
+  """
+
+  crc = np.uint64(0)
+  n_sliced = buf.shape[0] - buf.shape[0] % 8
+
+  for i in range(0, n_sliced, 8):
+    word = np.uint64(0)
+    for j in range(8):
+      word = (word << np.uint64(8)) | np.uint64(buf[i + j])
+
+    word ^= crc << (np.uint64(64) - p)
+    crc = np.uint64(0)
+    for k in range(8):
+      crc ^= tables[k, (word >> np.uint64(8 * k)) & np.uint64(0xFF)]
+
+  for i in range(n_sliced, buf.shape[0]):
+    byte = np.uint64(buf[i])
+    if p >= 8:
+      crc = ((crc << np.uint64(8)) & mask) ^ \
+        tables[0, ((crc >> (p - np.uint64(8))) ^ byte) & np.uint64(0xFF)]
+    else:
+      crc = tables[0, ((crc << (np.uint64(8) - p)) ^ byte) & np.uint64(0xFF)]
+
+  return crc
+
+@njit("uint64[:](uint8[:, :], uint64[:, :], uint64, uint64)", cache=True, \
+  parallel=True)
+def _crc_table_rows(msgs, tables, p, mask):
+  """
+  Run _crc_table over every row of msgs, with the rows spread over threads
+  :param msgs: The messages, one per row
+  :param tables: Row k holds the remainder of each byte b * x^(p + 8k)
+  :param p: The degree of g
+  :param mask: The mask of the p-bit register
+  :return: The remainder of each row
+  """
+
+  crcs = np.empty(msgs.shape[0], dtype=np.uint64)
+  for i in prange(msgs.shape[0]):
+    crcs[i] = _crc_table(msgs[i], tables, p, mask)
+
+  return crcs
+
+# below this many messages, dividing each row on its own beats running the
+# table loop once per byte column over all of them
+COLUMN_BATCH_MIN = 32
+
+# the fastest remainder_bytes kernel available, chosen once at import; each
+# divider still falls back to the Python kernel if g is wider than 64 bits
+KERNEL = "numba" if HAVE_NUMBA else "python"
 
 class BinPolyDiv:
 
@@ -34,41 +101,188 @@ class BinPolyDiv:
     """
     self.g = to_bit_array(g, p + 1)
     self.p = p
-    self.lfsr = BinLFSR(g, self.p, initstate=0)
+    self.mask = (1 << p) - 1
+    self.g_low = g & self.mask
+
+    # remainder of each byte b * x^p, for dividing a byte at a time
+    self.table = [self._crc_byte(0, b) for b in range(256)]
+
+    # remainder of each byte b * x^(p + 8k), for dividing several bytes at a
+    # time; each table is the one before it with a zero byte shifted in
+    self.tables = [self.table]
+    for _ in range(SLICES - 1):
+      self.tables.append([self._crc_byte(r, 0) for r in self.tables[-1]])
+
+    self.np_table = None
+    self.np_tables = None
+    if p <= 64:
+      self.np_tables = np.array(self.tables, dtype=np.uint64)
+      self.np_table = self.np_tables[0]
+
+    # the compiled kernel needs the register to fit in 64 bits, and shifts
+    # the register by 64 - p bits, which must be less than 64
+    if KERNEL == "numba" and 0 < p <= 64:
+      self._kernel = self._remainder_bytes_numba
+    else:
+      self._kernel = self._remainder_bytes_python
+
+  def _crc_byte(self, crc, byte):
+    """
+    Shift one byte through the register a bit at a time
+    :param crc: The register state (integer)
+    :param byte: The byte to shift in, MSB first
+    :return: The new register state (integer)
+    """
+
+    # everything divides evenly by a degree 0 divisor
+    if self.p == 0:
+      return 0
+
+    for i in range(ITEM_SIZE - 1, -1, -1):
+      top = ((crc >> (self.p - 1)) ^ (byte >> i)) & 1
+      crc = (crc << 1) & self.mask
+      if top:
+        crc ^= self.g_low
+
+    return crc
+
+  def _remainder_table(self, d):
+    """
+    Divide a dividend by the divisor g a byte at a time using self.table.
+    Everything but the last p bits of d must be a whole number of bytes.
+    :param d: The dividend (numpy array or list) whose degree is its length-1
+    :return: The remainder (integer)
+    """
+
+    split = len(d) - self.p
+    msg = np.packbits(np.asarray(d[:split], dtype=np.uint8) & 1)
+
+    crc = self.remainder_bytes(msg)
+
+    # the last p bits are already below the degree of g
+    return crc ^ from_bit_array(d[split:])
 
   def _div(self, d):
     """
     Divide a dividend d by the divisor g
     :param d: The dividend (numpy array or list) whose degree is its length-1
-    :return: The quotient and remainder in a tuple
+    :return: The quotient and remainder (integers) in a tuple
     """
 
-    d_vec = d
-    self.lfsr.setstate(0)
-    state = to_bit_array(self.lfsr.state, self.p)
-    remainder = state
-    quotient = []
+    # a degree 0 divisor is 1, so the dividend is the quotient
+    if self.p == 0:
+      return from_bit_array(d), 0
 
-    for j in range(len(d_vec)):
+    state = 0
+    quotient = 0
 
-      # shift this bit into the state
-      if (remainder[0] % 2) ^ d_vec[j]:
-        state[len(state)-1] = 1
-      else:
-        state[len(state)-1] = 0
-      self.lfsr.setstate(from_bit_array(state))
-      remainder = state
+    for bit in d:
 
-      result = self.lfsr.step(state=True)
-      state = to_bit_array(result[1], self.p)
+      # shift this bit into the state, subtracting g if x^p is shifted out
+      top = (state >> (self.p - 1)) & 1
+      state = ((state << 1) & self.mask) | (int(bit) & 1)
+      if top:
+        state ^= self.g_low
 
-      # push this bit into the quotient vector
-      if j != len(d_vec) - 1:
-        quotient.append(remainder[0])
+      # push this bit into the quotient
+      quotient = (quotient << 1) | top
 
-    return np.array(quotient, dtype=int), remainder
+    return quotient, state
 
 
+  def remainder_bytes(self, msg):
+    """
+    Divide a message of bytes, multiplied by x^p, by the divisor g using
+    the byte tables. This is the CRC remainder of the message.
+    :param msg: The message (bytes, or list or array of integers), MSB first
+    :return: The remainder (integer)
+    """
+
+    return self._kernel(msg)
+
+  def _remainder_bytes_numba(self, msg):
+    """
+    remainder_bytes using the compiled slice-by-8 kernel
+    :param msg: The message (bytes, or list or array of integers)
+    :return: The remainder (integer)
+    """
+
+    if isinstance(msg, (bytes, bytearray, memoryview)):
+      buf = np.frombuffer(msg, dtype=np.uint8)
+    else:
+      buf = np.ascontiguousarray(msg, dtype=np.uint8)
+
+    # the compiled kernel only takes writable arrays
+    if not buf.flags.writeable:
+      buf = buf.copy()
+
+    return int(_crc_table(buf, self.np_tables, np.uint64(self.p), \
+      np.uint64(self.mask)))
+
+  def _remainder_bytes_python(self, msg):
+    """
+    remainder_bytes using the byte table a byte at a time
+    :param msg: The message (bytes, or list or array of integers)
+    :return: The remainder (integer)
+    """
+
+    if not isinstance(msg, (bytes, bytearray, memoryview)):
+      msg = np.asarray(msg, dtype=np.uint8).tobytes()
+
+    crc = 0
+    if self.p >= ITEM_SIZE:
+      shift = self.p - ITEM_SIZE
+      for byte in msg:
+        crc = ((crc << ITEM_SIZE) & self.mask) ^ \
+          self.table[((crc >> shift) ^ byte) & 0xFF]
+    else:
+      shift = ITEM_SIZE - self.p
+      for byte in msg:
+        crc = self.table[((crc << shift) ^ byte) & 0xFF]
+
+    return crc
+
+  def remainder_bytes_batch(self, M):
+    """
+    Divide many messages of bytes, each multiplied by x^p, by the divisor g
+    :param M: The messages (2D array of integers, one message per row)
+    :return: The remainders (numpy array, uint64 if p <= 64)
+    """
+
+    M = np.asarray(M, dtype=np.uint8)
+
+    # too wide for a machine word, so go one message at a time
+    if self.np_table is None:
+      return np.array([self.remainder_bytes(row) for row in M], dtype=object)
+
+    # compiled, each message gets its own thread
+    if self._kernel == self._remainder_bytes_numba:
+      msgs = np.ascontiguousarray(M)
+      if not msgs.flags.writeable:
+        msgs = msgs.copy()
+      return _crc_table_rows(msgs, self.np_tables, np.uint64(self.p), \
+        np.uint64(self.mask))
+
+    # interpreted, a few long messages are quickest one at a time
+    if len(M) < COLUMN_BATCH_MIN:
+      return np.array([self._kernel(row) for row in M], dtype=np.uint64)
+
+    # otherwise run the table loop once per byte column, over every message
+    crc = np.zeros(len(M), dtype=np.uint64)
+    if self.p >= ITEM_SIZE:
+      shift = self.p - ITEM_SIZE
+      for j in range(M.shape[1]):
+        column = M[:, j].astype(np.uint64)
+        crc = ((crc << ITEM_SIZE) & self.mask) ^ \
+          self.np_table[((crc >> shift) ^ column) & 0xFF]
+    else:
+      shift = ITEM_SIZE - self.p
+      for j in range(M.shape[1]):
+        column = M[:, j].astype(np.uint64)
+        crc = self.np_table[((crc << shift) ^ column) & 0xFF]
+
+    return crc
+
   def div(self, d):
     """
     Divide a dividend d by the divisor g, and return the quotient
@@ -76,16 +290,31 @@ class BinPolyDiv:
     :return: The quotient (integer)
     """
 
-    return int(from_bit_array(self._div(d)[0]))
+    return self._div(d)[0]
 
   def remainder(self, d):
     """
     Divide a dividend by the divisor g, and return the remainder
     :param d: The dividend (numpy array or list) whose degree is its length-1
-    :return: The quotient (integer)
+    :return: The remainder (integer)
     """
 
-    return int(from_bit_array(self._div(d)[1]))
+    if len(d) >= self.p and (len(d) - self.p) % ITEM_SIZE == 0:
+      return self._remainder_table(d)
+
+    return self._div(d)[1]
+
+@functools.lru_cache(maxsize=None)
+def get_divider(g, p):
+  """
+  Get a shared BinPolyDiv for a divisor, building its tables only once.
+  Dividers hold no state between divisions, so they are safe to share.
+  :param g: The divisor polynomial (integer)
+  :param p: The degree of the divisor
+  :return: The BinPolyDiv
+  """
+
+  return BinPolyDiv(g, p)
 
 if __name__ == "__main__":
   # The following is a test of the BinPolyDiv class
@@ -111,3 +340,25 @@ if __name__ == "__main__":
     print(i_vec,"/",gen_vec,"=",to_bit_array(bin_div.div(i_vec),3), \
       "R:",to_bit_array(bin_div.remainder(i_vec),2))
 
+
+  # every kernel that can run here should agree with bit-at-a-time division
+  print("\nChecking the remainder kernels against bit-at-a-time division",
+    "(default kernel: {})".format(KERNEL))
+  msg = bytes(range(0, 256, 7))
+  for generator in [0b1011, 0x18005, 0x104C11DB7, (1 << 70) | 0x3]:
+    p = generator.bit_length() - 1
+    bin_div = BinPolyDiv(generator, p)
+    bits = np.concatenate([np.unpackbits(np.frombuffer(msg, dtype=np.uint8)), \
+      np.zeros(p, dtype=np.uint8)])
+    expected = bin_div._div(bits)[1]
+
+    kernels = {"python": bin_div._remainder_bytes_python}
+    if HAVE_NUMBA and p <= 64:
+      kernels["numba"] = bin_div._remainder_bytes_numba
+
+    for name, kernel in kernels.items():
+      print("Degree", p, name, "kernel:", end=" ")
+      if kernel(msg) == expected:
+        print("(Remainders match)")
+      else:
+        print("(Remainders differ)")
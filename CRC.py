@@ -17,13 +17,76 @@ CRC.py - A generic cyclic redundancy check (CRC) script that accepts any valid
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from BinLFSR import BinLFSR
 from bit_array_utils import *
-from BinPolyDiv import BinPolyDiv
+from BinPolyDiv import get_divider
 import numpy as np
 
 ITEM_SIZE = 8 # size of a byte
 
+def specialized_source(g, name):
+  """
+  Write the source of a CRC function with the table of g baked in
+  :param g: The generator polynomial (integer)
+  :param name: The name of the function (the table is NAME_TABLE)
+  :return: The source code (string)
+  """
+
+  p = g.bit_length() - 1
+  table_name = name.upper() + "_TABLE"
+  table = get_divider(g, p).table
+
+  digits = (p + 3) // 4
+  entries = ["0x{:0{}X},".format(t, digits) for t in table]
+  per_line = max(1, 64 // (digits + 4))
+  lines = [" ".join(entries[i:i + per_line]) \
+    for i in range(0, len(entries), per_line)]
+
+  if p >= ITEM_SIZE:
+    update = "((crc << 8) & 0x{:X}) ^ {}[((crc >> {}) ^ byte) & 0xFF]"\
+      .format((1 << p) - 1, table_name, p - ITEM_SIZE)
+  else:
+    update = "{}[((crc << {}) ^ byte) & 0xFF]"\
+      .format(table_name, ITEM_SIZE - p)
+
+  return "\n".join([
+    "{} = (".format(table_name),
+    *["  " + line for line in lines],
+    ")",
+    "",
+    "def {}(buf):".format(name),
+    "  \"\"\"",
+    "  CRC remainder of a message for the generator 0x{:X}".format(g),
+    "  :param buf: The message (bytes, or list or array of integers)",
+    "  :return: The remainder (integer)",
+    "  \"\"\"",
+    "",
+    "  if not isinstance(buf, (bytes, bytearray, memoryview)):",
+    "    buf = bytes([int(b) for b in buf])",
+    "",
+    "  crc = 0",
+    "  for byte in buf:",
+    "    crc = " + update,
+    "",
+    "  return crc",
+    ""])
+
+def _as_bytes(m):
+  """
+  Turn a message into an array of bytes
+  :param m: The message (bytes, or list or array of integers), of any shape
+  :return: The message (numpy array of uint8), keeping the low 8 bits of each
+    integer
+  """
+
+  if isinstance(m, (bytes, bytearray, memoryview)):
+    return np.frombuffer(bytes(m), dtype=np.uint8)
+
+  m = np.asarray(m)
+  if m.dtype != np.uint8:
+    m = (m & 0xFF).astype(np.uint8)
+
+  return m
+
 class CRC:
 
   def __init__(self, g, n):
@@ -35,38 +98,93 @@ class CRC:
 
     self.g = g
     self.n = n
-    self.crc_len = len(to_bit_array(g))
-    self.divider = BinPolyDiv(g,self.crc_len - 1)
+    self.p = g.bit_length() - 1
+    self.crc_len = self.p + 1
+    self.payload_bits = self.n * ITEM_SIZE
+    self.divider = get_divider(g, self.p)
+
+    # bit positions of the remainder, for unpacking it into the codeword
+    self.r_shifts = None
+    if self.p <= 64:
+      self.r_shifts = np.arange(self.p - 1, -1, -1, dtype=np.uint64)
+
+  @staticmethod
+  def specialize(g, name="crc"):
+    """
+    Build a standalone CRC function for one generator, with its table baked
+    in as a literal, for when a generator is fixed ahead of time
+    :param g: The generator polynomial (integer)
+    :param name: The name of the generated function
+    :return: The function, taking a message of bytes and returning its
+      remainder (integer)
+    """
+
+    namespace = {}
+    exec(specialized_source(g, name), namespace)
+
+    return namespace[name]
+
+  def _remainder_bits(self, r):
+    """
+    Unpack remainders into bits, MSB first
+    :param r: A remainder (integer) or array of remainders
+    :return: The bits, with one extra axis of length p (numpy array)
+    """
+
+    # too wide for a machine word, so go one remainder at a time
+    if self.r_shifts is None:
+      bits = [to_bit_array(x, self.p) for x in np.ravel(r)]
+      return np.array(bits, dtype=np.uint8).reshape(np.shape(r) + (self.p,))
+
+    r = np.asarray(r, dtype=np.uint64)[..., None]
+
+    return ((r >> self.r_shifts) & 1).astype(np.uint8)
 
   def encode_bytes(self, m, size=ITEM_SIZE):
     """
     Encode a given message byte (integer)
-    :param m: The message vector (array of integers, length n)
+    :param m: The message vector (bytes, or array of integers, length n)
     :param size: The size of each byte (default 8)
-    :return: The codeword (array of bits)
+    :return: The codeword (numpy array of bits)
     """
 
     # c(x) = x^12m(x) + d(x)
 
-    # turn message bytes into a list of bits
-    c_list = []
-    for i in range(self.n):
-      for j in range(ITEM_SIZE-1,-1,-1):
-        c_list.append((m[i] // (2**j)) % 2)
+    msg = _as_bytes(m[:self.n])
 
-    # append 0's to the end of this vector (multiplying by x^crc_len)
-    for i in range(self.crc_len-1):
-      c_list.append(0)
+    # turn message bytes into a list of bits, followed by crc_len-1 0's
+    # (multiplying by x^crc_len)
+    c_list = np.zeros(self.payload_bits + self.p, dtype=np.uint8)
+    c_list[:self.payload_bits] = np.unpackbits(msg)
 
-    # get remainder from the divider circuit
-    r = to_bit_array(self.divider.remainder(c_list),self.crc_len-1)
+    # get remainder straight from the message bytes
+    r = self.divider.remainder_bytes(msg)
 
     # add the remainder to the codeword
-    for i in range(self.n * ITEM_SIZE, len(c_list)):
-      c_list[i] = r[i - (self.n * ITEM_SIZE)]
+    c_list[self.payload_bits:] = self._remainder_bits(r)
 
     return c_list
 
+  def encode_bytes_batch(self, M):
+    """
+    Encode many messages at once
+    :param M: The messages (2D array of integers, shape (N, n), or a list of
+      bytes)
+    :return: The codewords (numpy array of bits, one codeword per row)
+    """
+
+    if isinstance(M, np.ndarray):
+      M = _as_bytes(M)[:, :self.n]
+    else:
+      M = np.array([_as_bytes(row[:self.n]) for row in M], dtype=np.uint8)\
+        .reshape(-1, self.n)
+
+    # get every remainder in one pass over the message bytes
+    r = self.divider.remainder_bytes_batch(M)
+
+    return np.concatenate([np.unpackbits(M, axis=1), self._remainder_bits(r)], \
+      axis=1)
+
   def decode(self, received):
     """
     Decode a given bitstream, and pass back the original list of bytes
@@ -78,15 +196,15 @@ class CRC:
     # find if an error was transmitted
     remainder = self.divider.remainder(received)
     
-    m_list = []
-    for i in range(self.n):
-      m_list.append(from_bit_array(\
-        received[i*ITEM_SIZE:i*ITEM_SIZE + ITEM_SIZE]))
+    # pack the payload bits back into bytes
+    payload = np.asarray(received[:self.payload_bits], dtype=np.uint8) & 1
+    m_list = np.packbits(payload).tolist()
 
     return m_list, remainder
 
 # A demonstration of the CRC class using CRC_ANSI
 if __name__ == "__main__":
+  from crc16_ansi import crc16_ansi
 
   CRC_GEN =  0x18005 # CRC-ANSI generator
 
@@ -135,3 +253,32 @@ if __name__ == "__main__":
     print("(Error detected) Remainder: %d\n" % decoded[1])
   else:
     print("(No error detected)\n")
+
+  print("Checking against the precomputed CRC-16-ANSI table:", end=" ")
+  if crc16_ansi(bigger_payload) == from_bit_array(encoded[-crc.p:]):
+    print("(Remainders match)")
+  else:
+    print("(Remainders differ)")
+
+  print("Checking batch encoding against encoding one payload at a time:", \
+    end=" ")
+  payloads = [payload, [0xFF, 0x00], b"\x12\x34"]
+  batch = crc.encode_bytes_batch(payloads)
+  one_at_a_time = np.array([crc.encode_bytes(p) for p in payloads])
+  empty = crc.encode_bytes_batch([])
+  if np.array_equal(batch, one_at_a_time) and \
+    empty.shape == (0, one_at_a_time.shape[1]):
+    print("(Codewords match)")
+  else:
+    print("(Codewords differ)")
+
+  CRC32_GEN = 0x104C11DB7 # CRC-32 generator
+  crc32 = CRC(CRC32_GEN, len(bigger_payload))
+
+  print("Checking a specialized CRC-32 against the generic one:", end=" ")
+  crc32_specialized = CRC.specialize(CRC32_GEN, "crc32")
+  encoded = crc32.encode_bytes(bigger_payload)
+  if crc32_specialized(bigger_payload) == from_bit_array(encoded[-crc32.p:]):
+    print("(Remainders match)")
+  else:
+    print("(Remainders differ)")
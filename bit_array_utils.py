@@ -19,33 +19,29 @@ bit_array_utils.py - A collection of two functions that convert integer lists
 
 import numpy as np
 
-def to_bit_array(num, length=None):
+def to_bit_array(num, length=None, dtype=np.uint8):
   """
   Converts an integer into a bit array (LSB on right)
   :param num: The number to convert
   :param length: Optional length of bit vector to produce
+  :param dtype: The numpy type of each bit (default uint8)
   :return: numpy array of bits
   """
 
+  num = int(num)
+
   # first find order of the number (highest power of 2)
-  power = 0
   if length:
     power = length
   else:
-    while num // (2 ** power):
-      power += 1
-
-    if power == 0:
-      power = 1 # prevent an empty list
-
-  arr = []
+    power = max(1, num.bit_length()) # prevent an empty list
 
-  # fill arr with values
-  for i in range(power):
+  # unpack the bytes of the number, then drop the padding above the top bit
+  n_bytes = (power + 7) // 8
+  packed = (num & ((1 << power) - 1)).to_bytes(n_bytes, "big")
+  bits = np.unpackbits(np.frombuffer(packed, dtype=np.uint8))
 
-    arr.append((num // 2 ** (power - i - 1)) % 2)
-
-  return np.array(arr, dtype = int)
+  return bits[len(bits) - power:].astype(dtype, copy=False)
 
 def from_bit_array(arr):
   """
@@ -54,9 +50,13 @@ def from_bit_array(arr):
   :return: The integer
   """
 
-  integer = 0
+  if len(arr) == 0:
+    return 0
+
+  bits = np.asarray(arr) & 1
 
-  for power in range(len(arr)):
-    integer += (arr[len(arr) - power - 1] % 2) * (2 ** power)
+  # pack the bits into bytes, then drop the padding below the last bit
+  packed = np.packbits(bits)
+  pad = len(packed) * 8 - len(bits)
 
-  return integer
\ No newline at end of file
+  return int.from_bytes(packed.tobytes(), "big") >> pad
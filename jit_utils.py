@@ -0,0 +1,37 @@
+"""
+jit_utils.py - Optional support for compiling hot loops with Numba. If Numba
+    is not installed, njit leaves functions as plain Python and prange is
+    range.
+    Copyright (C) 2022  Austin Grieve
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+try:
+  from numba import njit, prange
+  HAVE_NUMBA = True
+except ImportError:
+  HAVE_NUMBA = False
+  prange = range
+
+  def njit(*args, **kwargs):
+    """
+    Stand-in for numba.njit that returns the function unchanged
+    :return: The function, or a decorator that returns it
+    """
+
+    if len(args) == 1 and callable(args[0]) and not kwargs:
+      return args[0]
+
+    return lambda func: func